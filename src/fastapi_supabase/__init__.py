@@ -4,6 +4,8 @@ FastAPI Supabase - A lightweight authentication integration for FastAPI and Supa
 from fastapi_supabase.config import SupabaseAuthConfig
 from fastapi_supabase.auth import JWTAuthenticator
 from fastapi_supabase.middleware import add_cors_middleware
+from fastapi_supabase.refresh import TokenRefresher
+from fastapi_supabase.permissions import PermissionLoader
 
 __version__ = "0.1.0"
-__all__ = ["SupabaseAuthConfig", "JWTAuthenticator", "add_cors_middleware"]
\ No newline at end of file
+__all__ = ["SupabaseAuthConfig", "JWTAuthenticator", "add_cors_middleware", "TokenRefresher", "PermissionLoader"]
\ No newline at end of file
@@ -1,12 +1,19 @@
+import asyncio
+import time
+from collections import Counter
 from functools import wraps
+from cachetools import TLRUCache
 from fastapi import Depends, HTTPException, Security, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from typing import Dict, List, Optional, Callable
-from datetime import datetime
 from .config import SupabaseAuthConfig
 from .jwt_checker import JWTChecker
 from .legacy_jwt_checker import LegacyJWTChecker
+from .hybrid_jwt_checker import HybridJWTChecker
 from .models import TokenData
+from .response_cache import ResponseCache
+
+LOOP_LAG_INTERVAL = 0.1  # seconds between event-loop lag samples
 
 class JWTAuthenticator:
     def __init__(
@@ -17,30 +24,98 @@ class JWTAuthenticator:
         leeway: int = 30,
     ):
         self.config = config
-        if config.supa_use_legacy_jwt:
+        if config.jwt_mode == "hybrid":
+            self.checker = HybridJWTChecker(config, aud, iss, leeway)
+        elif config.jwt_mode == "legacy":
             self.checker = LegacyJWTChecker(config, aud, iss, leeway)
         else:
             self.checker = JWTChecker(config, aud, iss, leeway)
 
+        # Verified tokens, each kept until the cache TTL or its own exp, whichever is first
+        self.token_cache = TLRUCache(
+            maxsize=config.auth_token_cache_size,
+            ttu=lambda token, token_data, now: now + min(
+                config.auth_token_cache_ttl, token_data.exp.timestamp() - time.time()
+            ),
+        )
+        self.inflight = 0
+        self.loop_lag_ms = 0.0
+        self._lag_monitor: Optional[asyncio.Task] = None
+        self.stats = Counter()
+
+    async def _monitor_loop_lag(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(LOOP_LAG_INTERVAL)
+            lag_ms = max(0.0, loop.time() - start - LOOP_LAG_INTERVAL) * 1000
+            # Spikes decay by half per sample, so shedding holds briefly after a stall
+            self.loop_lag_ms = max(lag_ms, self.loop_lag_ms / 2)
+
+    def _ensure_lag_monitor(self):
+        if self._lag_monitor is None or self._lag_monitor.done() \
+                or self._lag_monitor.get_loop() is not asyncio.get_running_loop():
+            self._lag_monitor = asyncio.ensure_future(self._monitor_loop_lag())
+
+    async def aclose(self):
+        """Stops the event-loop lag monitor; call it on application shutdown"""
+        monitor, self._lag_monitor = self._lag_monitor, None
+        if monitor is None or monitor.done():
+            return
+        monitor.cancel()
+        if monitor.get_loop() is asyncio.get_running_loop():
+            try:
+                await monitor
+            except asyncio.CancelledError:
+                pass
+
+    def _shed(self, reason: str):
+        self.stats[f"shed_{reason}"] += 1
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail={"code": "overloaded", "message": f"Authentication is overloaded ({reason}), retry later"},
+            headers={"Retry-After": str(self.config.auth_retry_after)},
+        )
+
+    def _admit(self):
+        """Sheds an uncached verification when the configured overload thresholds are crossed"""
+        max_inflight = self.config.auth_max_inflight
+        if max_inflight is not None and self.inflight >= max_inflight:
+            self._shed("inflight")
+        max_lag = self.config.auth_max_loop_lag_ms
+        if max_lag is not None:
+            self._ensure_lag_monitor()
+            if self.loop_lag_ms > max_lag:
+                self._shed("loop_lag")
+
+    async def _verify(self, token: str) -> TokenData:
+        """Verifies a token through the verified-token cache and admission control"""
+        # Already-verified tokens skip admission control, so they keep flowing under overload
+        token_data = self.token_cache.get(token)
+        if token_data is not None:
+            self.stats["cache_hits"] += 1
+            return token_data
+
+        self._admit()
+        self.inflight += 1
+        try:
+            token_data = await self.checker(HTTPAuthorizationCredentials(scheme="Bearer", credentials=token))
+        finally:
+            self.inflight -= 1
+        if self.config.auth_token_cache_ttl > 0:
+            self.token_cache[token] = token_data
+        return token_data
+
     async def __call__(
         self, 
         credentials: HTTPAuthorizationCredentials = Depends(HTTPBearer())
     ) -> TokenData:
-        return await self.checker(credentials)
+        return await self._verify(credentials.credentials)
         
     def require_auth(self , func: Callable) -> Callable:
         @wraps(func)
         async def wrapper(*args, credentials: HTTPAuthorizationCredentials = Security(HTTPBearer()), **kwargs):
-            payload = await self.checker.decode_token(credentials.credentials)
-            token_data = TokenData(
-                user_id=payload["sub"],
-                role=payload.get("role"),
-                email=payload.get("email"),
-                exp=datetime.fromtimestamp(payload["exp"]),
-                aud=payload.get("aud"),
-                iss=payload.get("iss"),
-                is_anonymous=payload.get("is_anonymous", True)
-            )
+            token_data = await self._verify(credentials.credentials)
             return await func(*args, token_data=token_data, **kwargs)
         return wrapper
 
@@ -75,3 +150,11 @@ class JWTAuthenticator:
                 return await func(*args, token_data=token_data, **kwargs)
             return wrapper
         return decorator
+
+    def cached(self, ttl: int = 60, scope: str = "user", maxsize: int = 1024) -> Callable:
+        """
+        Caches the endpoint response per route, query and claim scope ("user", "role"
+        or "public"), answering If-None-Match with 304. Apply it below the role
+        decorators so authorization is still checked on every request.
+        """
+        return ResponseCache(ttl=ttl, scope=scope, maxsize=maxsize)
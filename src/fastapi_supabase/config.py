@@ -1,6 +1,6 @@
 import os
 import logging
-from typing import Any, List, Optional
+from typing import Any, List, Literal, Optional
 
 # from pydantic import BaseConfig
 from pydantic_settings import BaseSettings
@@ -16,7 +16,22 @@ class SupabaseAuthConfig(BaseSettings):
     supa_url: Optional[str] = None
     supa_anon_key: Optional[str] = None
     supa_use_legacy_jwt: bool = False
+    # "jwks", "legacy" or "hybrid" (dispatch per token by header alg); overrides supa_use_legacy_jwt
+    supa_jwt_mode: Optional[Literal["jwks", "legacy", "hybrid"]] = None
     supa_jwks_url: Optional[str] = None
+    # JWKS HTTP caching: Cache-Control max-age is honored, clamped to [min, max]
+    supa_jwks_cache_ttl: int = 3600  # used when the endpoint sends no max-age
+    supa_jwks_min_ttl: int = 60  # also the minimum gap between refreshes forced by an unknown kid
+    supa_jwks_max_ttl: int = 86400
+    supa_jwks_refresh_jitter: float = 0.1  # fraction of the TTL, spreads refreshes
+
+    # Verified tokens are reused for up to this many seconds (never past exp); 0 disables
+    auth_token_cache_ttl: int = 0
+    auth_token_cache_size: int = 10000
+    # Overload protection: uncached verifications are shed with 503 past these limits (None disables)
+    auth_max_inflight: Optional[int] = None
+    auth_max_loop_lag_ms: Optional[float] = None
+    auth_retry_after: int = 1
 
 
     origins: Optional[List[str]] = None
@@ -42,6 +57,12 @@ class SupabaseAuthConfig(BaseSettings):
             # logger.info(f"Dev mode enabled with token: {self.dev_token}")
             logger.info(f"Dev user: {self.dev_user_id} with role: {self.dev_role}")
 
+    @property
+    def jwt_mode(self) -> str:
+        if self.supa_jwt_mode:
+            return self.supa_jwt_mode
+        return "legacy" if self.supa_use_legacy_jwt else "jwks"
+
     @field_validator("origins", mode="before")
     @classmethod
     def parse_origins(cls, value: Any) -> Optional[List[str]]:
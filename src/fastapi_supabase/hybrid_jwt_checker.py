@@ -0,0 +1,110 @@
+from collections import Counter
+from fastapi import Depends, HTTPException, status
+from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+import jwt
+from typing import Dict, Optional
+from datetime import datetime
+from .config import SupabaseAuthConfig
+from .jwt_checker import JWTChecker
+from .legacy_jwt_checker import LegacyJWTChecker
+from .models import TokenData
+
+# Fixed allowlist: the header alg picks the path, and each path only ever verifies its own algorithms
+LEGACY_ALGORITHMS = ("HS256",)
+JWKS_ALGORITHMS = ("RS256", "ES256")
+
+
+class HybridJWTChecker:
+    """
+    Verifies both legacy HS256 tokens and asymmetric JWKS tokens, for projects midway
+    through Supabase's migration to signing keys. Each token is routed by its header:
+    HS256 goes to the shared secret, RS256/ES256 with a kid go to the JWKS.
+    """
+
+    def __init__(
+        self,
+        config: SupabaseAuthConfig,
+        aud: Optional[str] = None,
+        iss: Optional[str] = None,
+        leeway: int = 30,
+    ):
+        self.config = config
+        self.aud = aud
+        self.iss = iss
+        self.leeway = leeway
+        self.security = HTTPBearer()
+        self.legacy = LegacyJWTChecker(config, aud, iss, leeway)
+        self.jwks = JWTChecker(config, aud, iss, leeway)
+        self.stats = {"legacy": Counter(), "jwks": Counter(), "rejected": Counter()}
+
+    def select_checker(self, token: str):
+        """Returns the name and checker for a token, rejecting algorithms outside the allowlist"""
+        try:
+            header = jwt.get_unverified_header(token)
+        except jwt.InvalidTokenError as e:
+            self.stats["rejected"]["malformed"] += 1
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail={"code": "invalid_token", "message": str(e)}
+            )
+
+        alg = header.get("alg")
+        if alg in LEGACY_ALGORITHMS and self.config.supa_jwt_secret:
+            return "legacy", self.legacy
+        if alg in JWKS_ALGORITHMS and header.get("kid"):
+            return "jwks", self.jwks
+
+        self.stats["rejected"][str(alg)] += 1
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail={"code": "unsupported_alg", "message": f"Unsupported token algorithm: {alg}"}
+        )
+
+    async def decode_token(self, token: str) -> Dict:
+        if self.config.dev_mode and self.config.dev_token:
+            return await self.jwks.decode_token(token)
+
+        name, checker = self.select_checker(token)
+        try:
+            payload = await checker.decode_token(token)
+        except HTTPException:
+            self.stats[name]["failed"] += 1
+            raise
+        self.stats[name]["verified"] += 1
+        return payload
+
+    async def __call__(
+        self,
+        credentials: HTTPAuthorizationCredentials = Depends(HTTPBearer())
+    ) -> TokenData:
+        try:
+            payload = await self.decode_token(credentials.credentials)
+
+            user_id = payload.get("sub")
+            if not user_id:
+                raise HTTPException(
+                    status_code=status.HTTP_401_UNAUTHORIZED,
+                    detail={
+                        "code": "missing_sub_claim",
+                        "message": "Token missing required sub claim"
+                    }
+                )
+
+            return TokenData(
+                user_id=user_id,
+                role=payload.get("role"),
+                email=payload.get("email"),
+                exp=datetime.fromtimestamp(payload["exp"]),
+                aud=payload.get("aud"),
+                iss=payload.get("iss"),
+                is_anonymous=payload.get("is_anonymous", True)
+            )
+
+        except Exception as e:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail={
+                    "code": "authentication_failed",
+                    "message": f"Authentication failed: {str(e)}"
+                }
+            )
@@ -1,3 +1,7 @@
+import asyncio
+import random
+import re
+import time
 from functools import wraps
 from fastapi import Depends, HTTPException, Security, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
@@ -6,9 +10,11 @@ from typing import Dict, List, Optional, Callable
 from datetime import datetime
 from .config import SupabaseAuthConfig
 import httpx
-from cachetools import TTLCache
 from .models import TokenData
 
+_MAX_AGE_RE = re.compile(r"(?:^|,)\s*max-age\s*=\s*\"?(\d+)\"?", re.IGNORECASE)
+_NO_CACHE_RE = re.compile(r"(?:^|,)\s*(no-cache|no-store)\b", re.IGNORECASE)
+
 class JWTChecker:
     def __init__(
         self, 
@@ -22,32 +28,97 @@ class JWTChecker:
         self.iss = iss
         self.leeway = leeway
         self.security = HTTPBearer()
-        self.jwks_cache = TTLCache(maxsize=1, ttl=3600)  # Cache JWKS for 1 hour
+        # JWKS document and the HTTP validators needed to revalidate it
+        self.jwks: Optional[Dict] = None
+        self.jwks_etag: Optional[str] = None
+        self.jwks_last_modified: Optional[str] = None
+        self.jwks_expires_at: float = 0.0
+        self.jwks_fetched_at: float = 0.0  # last download or revalidation, time.monotonic()
+        self._jwks_lock: Optional[asyncio.Lock] = None
+        # Parsed public keys for the current JWKS document, keyed by (kid, alg)
+        self._public_keys: Dict = {}
 
-    async def get_jwks(self):
-        if "jwks" in self.jwks_cache:
-            return self.jwks_cache["jwks"]
+    def _jwks_ttl(self, cache_control: Optional[str]) -> float:
+        """Lifetime of a JWKS response from its Cache-Control header, clamped and jittered"""
+        ttl = self.config.supa_jwks_cache_ttl
+        if cache_control:
+            if _NO_CACHE_RE.search(cache_control):
+                ttl = 0
+            else:
+                match = _MAX_AGE_RE.search(cache_control)
+                if match:
+                    ttl = int(match.group(1))
+        # Refresh early by a random fraction so instances don't refresh in lockstep
+        ttl *= 1 - random.uniform(0, self.config.supa_jwks_refresh_jitter)
+        return max(self.config.supa_jwks_min_ttl, min(ttl, self.config.supa_jwks_max_ttl))
 
-        async with httpx.AsyncClient() as client:
-            try:
-                res = await client.get(self.config.supa_jwks_url)
-                res.raise_for_status()
-                jwks = res.json()
-                self.jwks_cache["jwks"] = jwks
-                return jwks
-            except httpx.HTTPStatusError as e:
-                raise HTTPException(
-                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                    detail={"code": "jwks_fetch_failed", "message": f"Failed to fetch JWKS: {e}"}
-                )
+    def _jwks_is_fresh(self, force: bool) -> bool:
+        if self.jwks is None:
+            return False
+        if force:
+            # Forced refreshes are rate limited to one per supa_jwks_min_ttl
+            return time.monotonic() < self.jwks_fetched_at + self.config.supa_jwks_min_ttl
+        return time.monotonic() < self.jwks_expires_at
+
+    async def get_jwks(self, force: bool = False):
+        """
+        Returns the cached JWKS, revalidating it once expired. `force` revalidates
+        before expiry, e.g. after a key rotation, at most once per supa_jwks_min_ttl.
+        """
+        if self._jwks_is_fresh(force):
+            return self.jwks
+
+        if self._jwks_lock is None:
+            self._jwks_lock = asyncio.Lock()
+        async with self._jwks_lock:
+            # Another request may have refreshed the document while we waited
+            if self._jwks_is_fresh(force):
+                return self.jwks
+
+            headers = {}
+            if self.jwks is not None:
+                if self.jwks_etag:
+                    headers["If-None-Match"] = self.jwks_etag
+                if self.jwks_last_modified:
+                    headers["If-Modified-Since"] = self.jwks_last_modified
+
+            async with httpx.AsyncClient() as client:
+                try:
+                    res = await client.get(self.config.supa_jwks_url, headers=headers)
+                    if res.status_code == status.HTTP_304_NOT_MODIFIED and self.jwks is not None:
+                        self.jwks_fetched_at = time.monotonic()
+                        self.jwks_expires_at = time.monotonic() + self._jwks_ttl(res.headers.get("cache-control"))
+                        return self.jwks
+                    res.raise_for_status()
+                    jwks = res.json()
+                except httpx.HTTPStatusError as e:
+                    raise HTTPException(
+                        status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                        detail={"code": "jwks_fetch_failed", "message": f"Failed to fetch JWKS: {e}"}
+                    )
+
+            self.jwks = jwks
+            self.jwks_etag = res.headers.get("etag")
+            self.jwks_last_modified = res.headers.get("last-modified")
+            self.jwks_fetched_at = time.monotonic()
+            self.jwks_expires_at = self.jwks_fetched_at + self._jwks_ttl(res.headers.get("cache-control"))
+            self._public_keys = {}
+            return jwks
 
     def get_public_key(self, kid: str, jwks: Dict, alg: str):
+        if jwks is self.jwks and (kid, alg) in self._public_keys:
+            return self._public_keys[(kid, alg)]
         for jwk in jwks.get("keys", []):
             if jwk.get("kid") == kid and jwk.get("alg") == alg:
                 if alg == "RS256":
-                    return jwt.algorithms.RSAAlgorithm.from_jwk(jwk)
+                    public_key = jwt.algorithms.RSAAlgorithm.from_jwk(jwk)
                 elif alg == "ES256":
-                    return jwt.algorithms.ECAlgorithm.from_jwk(jwk)
+                    public_key = jwt.algorithms.ECAlgorithm.from_jwk(jwk)
+                else:
+                    continue
+                if jwks is self.jwks:
+                    self._public_keys[(kid, alg)] = public_key
+                return public_key
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail={"code": "invalid_kid", "message": "Invalid Key ID or Algorithm"}
@@ -82,7 +153,14 @@ class JWTChecker:
                 )
 
             jwks = await self.get_jwks()
-            public_key = self.get_public_key(kid, jwks, alg)
+            try:
+                public_key = self.get_public_key(kid, jwks, alg)
+            except HTTPException:
+                # The key set may have rotated since it was cached, so look once more
+                refreshed = await self.get_jwks(force=True)
+                if refreshed is jwks:
+                    raise
+                public_key = self.get_public_key(kid, refreshed, alg)
 
             issuer = self.iss or f"{self.config.supa_url}/auth/v1"
 
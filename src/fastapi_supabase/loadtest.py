@@ -0,0 +1,412 @@
+"""
+Token minting and load generation for apps protected by JWTAuthenticator.
+
+    python -m fastapi_supabase.loadtest keys --out keys/ --alg RS256 --alg ES256 --alg HS256
+    python -m fastapi_supabase.loadtest serve-jwks --keys keys/ --port 9999
+    python -m fastapi_supabase.loadtest mint --keys keys/ --count 10000 --role authenticated:9 --role admin:1 > tokens.txt
+    python -m fastapi_supabase.loadtest load --tokens tokens.txt --url http://127.0.0.1:8000/protected --concurrency 100
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import secrets
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Sequence, Tuple
+import httpx
+import jwt
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec, rsa
+
+ALGORITHMS = ("RS256", "ES256", "HS256")
+
+
+@dataclass
+class SigningKey:
+    kid: str
+    alg: str
+    key: object  # private key object, or the shared secret (str) for HS256
+
+    @classmethod
+    def generate(cls, alg: str, kid: Optional[str] = None) -> "SigningKey":
+        if alg == "RS256":
+            key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        elif alg == "ES256":
+            key = ec.generate_private_key(ec.SECP256R1())
+        elif alg == "HS256":
+            key = secrets.token_urlsafe(48)
+        else:
+            raise ValueError(f"Unsupported algorithm {alg!r}, expected one of {ALGORITHMS}")
+        return cls(kid=kid or f"{alg.lower()}-{uuid.uuid4().hex[:8]}", alg=alg, key=key)
+
+    def public_jwk(self) -> Optional[Dict]:
+        if self.alg == "HS256":
+            return None
+        algorithm = jwt.algorithms.RSAAlgorithm if self.alg == "RS256" else jwt.algorithms.ECAlgorithm
+        jwk = json.loads(algorithm.to_jwk(self.key.public_key()))
+        jwk.update({"kid": self.kid, "alg": self.alg, "use": "sig"})
+        return jwk
+
+    def to_dict(self) -> Dict:
+        if self.alg == "HS256":
+            secret = self.key
+        else:
+            secret = self.key.private_bytes(
+                serialization.Encoding.PEM,
+                serialization.PrivateFormat.PKCS8,
+                serialization.NoEncryption(),
+            ).decode()
+        return {"kid": self.kid, "alg": self.alg, "key": secret}
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "SigningKey":
+        key = data["key"]
+        if data["alg"] != "HS256":
+            key = serialization.load_pem_private_key(key.encode(), password=None)
+        return cls(kid=data["kid"], alg=data["alg"], key=key)
+
+
+class KeySet:
+    """A set of local signing keys and the JWKS that publishes their public halves"""
+
+    def __init__(self, keys: Sequence[SigningKey]):
+        self.keys = list(keys)
+
+    @classmethod
+    def generate(cls, algs: Sequence[str] = ("RS256",)) -> "KeySet":
+        return cls([SigningKey.generate(alg) for alg in algs])
+
+    @classmethod
+    def load(cls, path: str) -> "KeySet":
+        with open(os.path.join(path, "keys.json")) as f:
+            return cls([SigningKey.from_dict(k) for k in json.load(f)])
+
+    def save(self, path: str):
+        os.makedirs(path, exist_ok=True)
+        with open(os.path.join(path, "keys.json"), "w") as f:
+            json.dump([k.to_dict() for k in self.keys], f, indent=2)
+        with open(os.path.join(path, "jwks.json"), "w") as f:
+            json.dump(self.jwks(), f, indent=2)
+
+    def jwks(self) -> Dict:
+        return {"keys": [jwk for jwk in (k.public_jwk() for k in self.keys) if jwk]}
+
+    @property
+    def hs256_secret(self) -> Optional[str]:
+        return next((k.key for k in self.keys if k.alg == "HS256"), None)
+
+    def get(self, kid: str) -> SigningKey:
+        for key in self.keys:
+            if key.kid == kid:
+                return key
+        raise KeyError(kid)
+
+
+class JWKSServer:
+    """
+    Serves a KeySet's JWKS over HTTP from a background thread. The ETag follows the
+    current `keyset`, so swapping it simulates a key rotation; `request_headers`
+    records what each request sent.
+    """
+
+    def __init__(
+        self,
+        keyset: KeySet,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        max_age: int = 600,
+        cache_control: Optional[str] = None,
+    ):
+        self.keyset = keyset
+        self.cache_control = cache_control or f"public, max-age={max_age}"
+        self.request_headers: List[Dict[str, str]] = []
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                server.request_headers.append(dict(self.headers))
+                body = json.dumps(server.keyset.jwks()).encode()
+                etag = f'"{uuid.uuid5(uuid.NAMESPACE_OID, body.decode()).hex}"'
+                not_modified = self.headers.get("If-None-Match") == etag
+                if not_modified:
+                    self.send_response(304)
+                else:
+                    self.send_response(200)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(body)))
+                self.send_header("Cache-Control", server.cache_control)
+                self.send_header("ETag", etag)
+                self.end_headers()
+                if not not_modified:
+                    self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.url = f"http://{host}:{self.httpd.server_address[1]}/auth/v1/.well-known/jwks.json"
+
+    @property
+    def requests(self) -> int:
+        return len(self.request_headers)
+
+    def start(self) -> "JWKSServer":
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def _weighted(choices: Dict[str, float], rng: random.Random) -> str:
+    return rng.choices(list(choices), weights=list(choices.values()))[0]
+
+
+def mint_tokens(
+    keyset: KeySet,
+    count: int,
+    roles: Optional[Dict[str, float]] = None,
+    kids: Optional[Dict[str, float]] = None,
+    anonymous_ratio: float = 0.0,
+    expiry: Tuple[int, int] = (3600, 3600),
+    users: Optional[int] = None,
+    iss: Optional[str] = None,
+    aud: Optional[str] = "authenticated",
+    claims: Optional[Dict] = None,
+    seed: Optional[int] = None,
+) -> List[str]:
+    """
+    Mints `count` tokens. `roles` and `kids` map values to relative weights; `kids`
+    defaults to the keys published in the JWKS, or every key when none is. Each token's
+    lifetime is drawn uniformly from `expiry` (seconds, negative for already expired);
+    `users` bounds the number of distinct `sub` values.
+    """
+    rng = random.Random(seed)
+    roles = roles or {"authenticated": 1}
+    kids = kids or {k.kid: 1 for k in keyset.keys if k.alg != "HS256"} or {k.kid: 1 for k in keyset.keys}
+    signing_keys = {kid: keyset.get(kid) for kid in kids}
+    now = int(time.time())
+    tokens = []
+    for i in range(count):
+        user = rng.randrange(users) if users else i
+        is_anonymous = rng.random() < anonymous_ratio
+        payload = {
+            "sub": str(uuid.UUID(int=user)),
+            "role": _weighted(roles, rng),
+            "email": None if is_anonymous else f"user{user}@example.com",
+            "is_anonymous": is_anonymous,
+            "iat": now,
+            "exp": now + rng.randint(*expiry),
+        }
+        if iss:
+            payload["iss"] = iss
+        if aud:
+            payload["aud"] = aud
+        payload.update(claims or {})
+        key = signing_keys[_weighted(kids, rng)]
+        tokens.append(jwt.encode(payload, key.key, algorithm=key.alg, headers={"kid": key.kid}))
+    return tokens
+
+
+@dataclass
+class LoadReport:
+    duration: float = 0.0
+    latencies: List[float] = field(default_factory=list)
+    status_codes: Counter = field(default_factory=Counter)
+    error_codes: Counter = field(default_factory=Counter)
+
+    @property
+    def requests(self) -> int:
+        return len(self.latencies)
+
+    @property
+    def throughput(self) -> float:
+        return self.requests / self.duration if self.duration else 0.0
+
+    def percentile(self, p: float) -> float:
+        if not self.latencies:
+            return 0.0
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+    def to_dict(self) -> Dict:
+        return {
+            "requests": self.requests,
+            "duration_s": round(self.duration, 3),
+            "throughput_rps": round(self.throughput, 1),
+            "latency_ms": {f"p{p}": round(self.percentile(p) * 1000, 2) for p in (50, 90, 95, 99)},
+            "status_codes": dict(self.status_codes),
+            "error_codes": dict(self.error_codes),
+        }
+
+
+def _error_code(response: httpx.Response) -> str:
+    try:
+        detail = response.json().get("detail")
+    except (ValueError, AttributeError):
+        detail = None
+    if isinstance(detail, dict) and "code" in detail:
+        return detail["code"]
+    return f"http_{response.status_code}"
+
+
+async def run_load(
+    url: str,
+    tokens: Sequence[str],
+    total_requests: int = 1000,
+    concurrency: int = 50,
+    method: str = "GET",
+    timeout: float = 10.0,
+    app=None,
+) -> LoadReport:
+    """
+    Sends `total_requests` requests to `url` from `concurrency` workers, cycling through
+    `tokens`. Pass an ASGI `app` to drive it in-process instead of over the network.
+    """
+    report = LoadReport()
+    counter = iter(range(total_requests))
+    transport = httpx.ASGITransport(app=app) if app is not None else None
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async def worker(client: httpx.AsyncClient):
+        for i in counter:
+            headers = {"Authorization": f"Bearer {tokens[i % len(tokens)]}"}
+            start = time.perf_counter()
+            try:
+                response = await client.request(method, url, headers=headers)
+            except httpx.HTTPError as e:
+                report.latencies.append(time.perf_counter() - start)
+                report.status_codes["error"] += 1
+                report.error_codes[type(e).__name__] += 1
+                continue
+            report.latencies.append(time.perf_counter() - start)
+            report.status_codes[response.status_code] += 1
+            if response.status_code >= 400:
+                report.error_codes[_error_code(response)] += 1
+
+    async with httpx.AsyncClient(transport=transport, limits=limits, timeout=timeout) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        report.duration = time.perf_counter() - start
+    return report
+
+
+def _parse_weights(values: Optional[List[str]]) -> Optional[Dict[str, float]]:
+    if not values:
+        return None
+    weights = {}
+    for value in values:
+        name, _, weight = value.partition(":")
+        try:
+            weights[name] = float(weight or 1)
+        except ValueError:
+            weights[name] = 0
+        if not name or weights[name] <= 0:
+            raise ValueError(f"invalid {value!r}, expected name[:weight] with a positive weight")
+    return weights
+
+
+def main(argv: Optional[Sequence[str]] = None):
+    parser = argparse.ArgumentParser(prog="python -m fastapi_supabase.loadtest", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    keys = commands.add_parser("keys", help="generate signing keys and their JWKS")
+    keys.add_argument("--out", required=True, help="directory for keys.json and jwks.json")
+    keys.add_argument("--alg", action="append", choices=ALGORITHMS, help="repeat for several keys (default RS256)")
+
+    serve = commands.add_parser("serve-jwks", help="serve the JWKS of a key directory")
+    serve.add_argument("--keys", required=True)
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=9999)
+    serve.add_argument("--max-age", type=int, default=600)
+
+    mint = commands.add_parser("mint", help="print tokens, one per line")
+    mint.add_argument("--keys", required=True)
+    mint.add_argument("--count", type=int, default=1)
+    mint.add_argument("--role", action="append", help="role[:weight], repeatable")
+    mint.add_argument("--kid", action="append",
+                      help="kid[:weight], repeatable (default: the RS256/ES256 keys, HS256 only when it is the sole key)")
+    mint.add_argument("--anonymous-ratio", type=float, default=0.0)
+    mint.add_argument("--expiry-min", type=int, default=3600, help="seconds, negative for expired tokens")
+    mint.add_argument("--expiry-max", type=int, default=3600)
+    mint.add_argument("--users", type=int, help="number of distinct subjects")
+    mint.add_argument("--iss", help="issuer, e.g. https://<project>.supabase.co/auth/v1")
+    mint.add_argument("--aud", default="authenticated")
+    mint.add_argument("--seed", type=int)
+
+    load = commands.add_parser("load", help="drive concurrent load and report latency")
+    load.add_argument("--url", required=True)
+    load.add_argument("--tokens", required=True, help="file with one token per line")
+    load.add_argument("--requests", type=int, default=1000)
+    load.add_argument("--concurrency", type=int, default=50)
+    load.add_argument("--method", default="GET")
+    load.add_argument("--timeout", type=float, default=10.0)
+
+    args = parser.parse_args(argv)
+
+    if args.command == "keys":
+        keyset = KeySet.generate(args.alg or ["RS256"])
+        keyset.save(args.out)
+        for key in keyset.keys:
+            print(f"{key.kid}\t{key.alg}")
+    elif args.command == "serve-jwks":
+        server = JWKSServer(KeySet.load(args.keys), args.host, args.port, args.max_age)
+        print(f"Serving JWKS at {server.url}")
+        try:
+            server.httpd.serve_forever()
+        except KeyboardInterrupt:
+            server.httpd.server_close()
+    elif args.command == "mint":
+        if args.expiry_min > args.expiry_max:
+            parser.error("--expiry-min must not be greater than --expiry-max")
+        if not 0 <= args.anonymous_ratio <= 1:
+            parser.error("--anonymous-ratio must be between 0 and 1")
+        try:
+            roles = _parse_weights(args.role)
+            kids = _parse_weights(args.kid)
+        except ValueError as e:
+            parser.error(str(e))
+        keyset = KeySet.load(args.keys)
+        unknown = [kid for kid in kids or () if kid not in {k.kid for k in keyset.keys}]
+        if unknown:
+            parser.error(f"unknown --kid {', '.join(unknown)}; keys in {args.keys}: "
+                         f"{', '.join(k.kid for k in keyset.keys)}")
+        tokens = mint_tokens(
+            keyset,
+            args.count,
+            roles=roles,
+            kids=kids,
+            anonymous_ratio=args.anonymous_ratio,
+            expiry=(args.expiry_min, args.expiry_max),
+            users=args.users,
+            iss=args.iss,
+            aud=args.aud,
+            seed=args.seed,
+        )
+        sys.stdout.write("\n".join(tokens) + "\n")
+    elif args.command == "load":
+        with open(args.tokens) as f:
+            tokens = [line.strip() for line in f if line.strip()]
+        if not tokens:
+            parser.error(f"no tokens found in {args.tokens}")
+        report = asyncio.run(run_load(args.url, tokens, args.requests, args.concurrency, args.method, args.timeout))
+        print(json.dumps(report.to_dict(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
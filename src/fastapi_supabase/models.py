@@ -9,4 +9,7 @@ class TokenData(BaseModel):
     exp: datetime
     aud: Optional[str] = None
     iss: Optional[str] = None
-    is_anonymous : bool = True
\ No newline at end of file
+    is_anonymous : bool = True
+
+class RefreshRequest(BaseModel):
+    refresh_token: str
@@ -0,0 +1,150 @@
+import asyncio
+from functools import wraps
+from typing import Awaitable, Callable, Dict, FrozenSet, Iterable, List, Optional, Set
+from cachetools import TTLCache
+from fastapi import Depends, HTTPException, status
+from .auth import JWTAuthenticator
+from .models import TokenData
+
+# Receives a batch of user ids, returns each user's permissions (missing users have none)
+PermissionFetcher = Callable[[List[str]], Awaitable[Dict[str, Iterable[str]]]]
+
+
+class PermissionLoader:
+    """
+    DataLoader-style loader for per-user authorization data kept outside the JWT,
+    e.g. org memberships in Postgres.
+
+    Lookups made within `batch_window` seconds are sent to `fetch` as one batch (at most
+    `max_batch_size` ids), concurrent lookups of the same user share one result, and
+    results are cached per user for `cache_ttl` seconds or until `invalidate()`.
+    """
+
+    def __init__(
+        self,
+        jwt_auth: JWTAuthenticator,
+        fetch: PermissionFetcher,
+        batch_window: float = 0.005,
+        max_batch_size: int = 100,
+        cache_ttl: int = 60,
+        cache_size: int = 10000,
+    ):
+        self.jwt_auth = jwt_auth
+        self.fetch = fetch
+        self.batch_window = batch_window
+        self.max_batch_size = max_batch_size
+        self.cache = TTLCache(maxsize=cache_size, ttl=cache_ttl)
+        self._pending: Dict[str, asyncio.Future] = {}
+        self._batch: Dict[str, asyncio.Future] = {}
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        # Strong references to running dispatches; the event loop only keeps weak ones
+        self._dispatches: Set[asyncio.Task] = set()
+
+        async def current_permissions(token_data: TokenData = Depends(jwt_auth)) -> FrozenSet[str]:
+            return await self.load(token_data.user_id)
+
+        # FastAPI dependency: `permissions = Depends(loader.current_permissions)`
+        self.current_permissions = current_permissions
+
+    async def load(self, user_id: str) -> FrozenSet[str]:
+        permissions = self.cache.get(user_id)
+        if permissions is not None:
+            return permissions
+
+        future = self._pending.get(user_id)
+        if future is None and user_id in self._batch:
+            # Invalidated before its batch was sent, so the pending lookup is still fresh
+            future = self._pending[user_id] = self._batch[user_id]
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = loop.create_future()
+            self._pending[user_id] = future
+            self._batch[user_id] = future
+            if len(self._batch) >= self.max_batch_size:
+                self._flush()
+            elif self._flush_handle is None:
+                self._flush_handle = loop.call_later(self.batch_window, self._flush)
+        return await asyncio.shield(future)
+
+    def _flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._batch = self._batch, {}
+        if batch:
+            task = asyncio.ensure_future(self._dispatch(batch))
+            self._dispatches.add(task)
+            task.add_done_callback(self._dispatches.discard)
+
+    async def _dispatch(self, futures: Dict[str, asyncio.Future]):
+        try:
+            results = await self.fetch(list(futures))
+            permissions = {user_id: frozenset(results.get(user_id, ())) for user_id in futures}
+            for user_id, future in futures.items():
+                # Skip caching when the user was invalidated while the batch was in flight
+                if self._pending.get(user_id) is future:
+                    del self._pending[user_id]
+                    self.cache[user_id] = permissions[user_id]
+                if not future.done():
+                    future.set_result(permissions[user_id])
+        except Exception as e:
+            self._settle(futures, e)
+        finally:
+            # Cancelled: never leave a waiter, or a later load() of the same user, hanging
+            self._settle(futures, None)
+
+    def _settle(self, futures: Dict[str, asyncio.Future], error: Optional[Exception]):
+        """Fails every unresolved future of a batch with `error`, or cancels them when it is None"""
+        for user_id, future in futures.items():
+            if future.done():
+                continue
+            if self._pending.get(user_id) is future:
+                del self._pending[user_id]
+            if error is None:
+                future.cancel()
+            else:
+                future.set_exception(error)
+                # Mark as retrieved in case every waiter has gone away
+                future.exception()
+
+    def invalidate(self, user_id: Optional[str] = None):
+        """Drops the cached permissions of one user, or of everyone when no id is given"""
+        if user_id is None:
+            self.cache.clear()
+            self._pending.clear()
+        else:
+            self.cache.pop(user_id, None)
+            self._pending.pop(user_id, None)
+
+    def require_anyof_roles(self, required_roles: List[str]) -> Callable:
+        """Like JWTAuthenticator.require_anyof_roles, but checks the loaded permissions"""
+        def decorator(func: Callable) -> Callable:
+            @wraps(func)
+            async def wrapper(*args, token_data: TokenData = Depends(self.jwt_auth), **kwargs):
+                permissions = await self.load(token_data.user_id)
+                if not any(role in permissions for role in required_roles):
+                    raise HTTPException(
+                        status_code=status.HTTP_403_FORBIDDEN,
+                        detail={
+                            "code": "insufficient_permissions",
+                            "message": f"Required roles: {required_roles}, current roles: {sorted(permissions)}"
+                        }
+                    )
+                return await func(*args, token_data=token_data, **kwargs)
+            return wrapper
+        return decorator
+
+
+class InMemoryPermissionFetcher:
+    """Local stand-in for a permissions table; records every batch it is asked for"""
+
+    def __init__(self, permissions: Optional[Dict[str, Iterable[str]]] = None, delay: float = 0.0):
+        self.permissions = {user_id: set(perms) for user_id, perms in (permissions or {}).items()}
+        self.delay = delay
+        self.batches: List[List[str]] = []
+
+    async def __call__(self, user_ids: List[str]) -> Dict[str, Iterable[str]]:
+        self.batches.append(list(user_ids))
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        return {user_id: set(self.permissions[user_id]) for user_id in user_ids if user_id in self.permissions}
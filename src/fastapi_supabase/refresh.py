@@ -0,0 +1,133 @@
+import asyncio
+import hashlib
+import logging
+from typing import Dict, Optional
+import httpx
+from cachetools import TTLCache
+from fastapi import APIRouter, HTTPException, status
+from fastapi.security import HTTPAuthorizationCredentials
+from .auth import JWTAuthenticator
+from .models import RefreshRequest
+
+logger = logging.getLogger(__name__)
+
+
+class TokenRefresher:
+    """
+    Server-side proxy for Supabase's refresh_token grant.
+
+    Concurrent refreshes of the same refresh token share one upstream call, and the
+    resulting session is reused for `cache_ttl` seconds, so parallel tabs or API calls
+    hitting an expired access token at once don't trip refresh-token reuse detection.
+    When the authenticator's token cache is enabled, the new access token is verified
+    and seeded into it.
+    Mount `refresher.router` on the app and call `aclose()` on shutdown.
+    """
+
+    def __init__(
+        self,
+        jwt_auth: JWTAuthenticator,
+        path: str = "/auth/refresh",
+        cache_ttl: int = 10,
+        cache_size: int = 10000,
+        timeout: float = 10.0,
+    ):
+        self.jwt_auth = jwt_auth
+        self.config = jwt_auth.config
+        self.timeout = timeout
+        self.sessions = TTLCache(maxsize=cache_size, ttl=cache_ttl)
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._client: Optional[httpx.AsyncClient] = None
+        self.router = APIRouter()
+        self.router.add_api_route(path, self.refresh_endpoint, methods=["POST"])
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=f"{self.config.supa_url}/auth/v1",
+                headers={"apikey": self.config.supa_anon_key or ""},
+                timeout=self.timeout,
+            )
+        return self._client
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def _fetch_session(self, refresh_token: str) -> Dict:
+        try:
+            res = await self.client.post(
+                "/token",
+                params={"grant_type": "refresh_token"},
+                json={"refresh_token": refresh_token},
+            )
+        except httpx.HTTPError as e:
+            raise HTTPException(
+                status_code=status.HTTP_502_BAD_GATEWAY,
+                detail={"code": "refresh_unavailable", "message": f"Failed to reach Supabase Auth: {e}"}
+            )
+        if res.status_code != status.HTTP_200_OK:
+            try:
+                body = res.json()
+            except ValueError:
+                body = {}
+            raise HTTPException(
+                status_code=res.status_code,
+                detail={
+                    "code": "refresh_failed",
+                    "message": body.get("error_description") or body.get("msg") or res.text,
+                }
+            )
+
+        try:
+            session = res.json()
+        except ValueError:
+            session = None
+        if not isinstance(session, dict):
+            raise HTTPException(
+                status_code=status.HTTP_502_BAD_GATEWAY,
+                detail={"code": "refresh_unavailable", "message": "Supabase Auth returned an invalid session"}
+            )
+        await self._seed_token_cache(session.get("access_token"))
+        return session
+
+    async def _seed_token_cache(self, access_token: Optional[str]):
+        """
+        Puts the new access token straight into the verified-token path. Best effort only:
+        Supabase has already rotated the refresh token, so the session must reach the
+        client even when verification fails or the authenticator is shedding load.
+        """
+        if not access_token or self.config.auth_token_cache_ttl <= 0:
+            return
+        try:
+            token_data = await self.jwt_auth.checker(
+                HTTPAuthorizationCredentials(scheme="Bearer", credentials=access_token)
+            )
+        except Exception as e:
+            logger.warning(f"Could not verify refreshed access token: {e}")
+            return
+        self.jwt_auth.token_cache[access_token] = token_data
+
+    async def refresh(self, refresh_token: str) -> Dict:
+        key = hashlib.sha256(refresh_token.encode()).hexdigest()
+        session = self.sessions.get(key)
+        if session is not None:
+            return session
+
+        future = self._inflight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(self._fetch_session(refresh_token))
+            self._inflight[key] = future
+
+            def done(f, key=key):
+                self._inflight.pop(key, None)
+                if not f.cancelled() and f.exception() is None:
+                    self.sessions[key] = f.result()
+
+            future.add_done_callback(done)
+        return await asyncio.shield(future)
+
+    async def refresh_endpoint(self, body: RefreshRequest) -> Dict:
+        return await self.refresh(body.refresh_token)
@@ -0,0 +1,206 @@
+import asyncio
+import hashlib
+import inspect
+import time
+from dataclasses import dataclass
+from functools import wraps
+from typing import Callable, Dict, List, Optional, Tuple
+from cachetools import TLRUCache
+from fastapi import Request, Response, status
+from fastapi.datastructures import DefaultPlaceholder
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from fastapi.routing import APIRoute, serialize_response
+from .models import TokenData
+
+CACHE_SCOPES = ("user", "role", "public")
+_REQUEST_PARAM = "_cache_request"
+
+
+@dataclass
+class CachedResponse:
+    body: bytes
+    status_code: int
+    headers: List[Tuple[bytes, bytes]]  # raw headers set by the handler, without Content-Length
+    etag: str
+    expires_at: float  # time.monotonic() deadline
+
+
+class ResponseCache:
+    """
+    Bounded LRU cache of endpoint responses keyed by route, query and a claim scope.
+
+    - scope="user": one entry per user (token `sub`)
+    - scope="role": one entry per role, shared by every user holding it
+    - scope="public": one entry shared by every authenticated caller
+
+    An entry never lives longer than `ttl` nor past the `exp` of the token that
+    produced it. Concurrent misses for the same key run the handler once; when its
+    response can't be cached (not 2xx, streamed, or setting cookies in a shared
+    scope) each waiter runs the handler itself instead of sharing it.
+    """
+
+    def __init__(self, ttl: int = 60, scope: str = "user", maxsize: int = 1024):
+        if scope not in CACHE_SCOPES:
+            raise ValueError(f"scope must be one of {CACHE_SCOPES}, got {scope!r}")
+        self.ttl = ttl
+        self.scope = scope
+        self.entries = TLRUCache(maxsize=maxsize, ttu=lambda key, value, now: value.expires_at)
+        self._inflight: Dict[Tuple, asyncio.Future] = {}
+
+    def key(self, request: Request, token_data: TokenData) -> Tuple:
+        if self.scope == "user":
+            claim = token_data.user_id
+        elif self.scope == "role":
+            claim = (token_data.role, token_data.is_anonymous)
+        else:
+            claim = None
+        query = tuple(sorted(request.query_params.multi_items()))
+        return (request.url.path, query, claim)
+
+    def clear(self):
+        self.entries.clear()
+
+    @staticmethod
+    async def _serialize(result, request: Request, sub_response: Optional[Response]) -> Response:
+        """Builds the response FastAPI would, honouring the route's response_model and status_code"""
+        route = request.scope.get("route")
+        if isinstance(route, APIRoute):
+            content = await serialize_response(
+                field=route.response_field,
+                response_content=result,
+                include=route.response_model_include,
+                exclude=route.response_model_exclude,
+                by_alias=route.response_model_by_alias,
+                exclude_unset=route.response_model_exclude_unset,
+                exclude_defaults=route.response_model_exclude_defaults,
+                exclude_none=route.response_model_exclude_none,
+            )
+            response_class = route.response_class
+            if isinstance(response_class, DefaultPlaceholder):
+                response_class = response_class.value
+            status_code = route.status_code or status.HTTP_200_OK
+        else:
+            content, response_class, status_code = jsonable_encoder(result), JSONResponse, status.HTTP_200_OK
+        if sub_response is not None and sub_response.status_code:
+            status_code = sub_response.status_code
+        response = response_class(content, status_code=status_code)
+        if sub_response is not None:
+            # Headers and cookies the handler set on its injected Response
+            response.headers.raw.extend(
+                (name, value) for name, value in sub_response.headers.raw if name != b"content-length"
+            )
+        return response
+
+    async def _render(
+        self,
+        handler: Callable,
+        request: Request,
+        token_data: TokenData,
+        sub_response: Optional[Response],
+    ):
+        result = await handler()
+        # Like FastAPI, a returned Response is sent as-is, ignoring the injected one
+        response = result if isinstance(result, Response) else await self._serialize(result, request, sub_response)
+        if not 200 <= response.status_code < 300 or not hasattr(response, "body"):
+            return response
+        if self.scope != "user" and "set-cookie" in response.headers:
+            return response
+
+        body = bytes(response.body)
+        # Never let the entry outlive the authorization of the token that produced it
+        remaining = min(self.ttl, token_data.exp.timestamp() - time.time())
+        return CachedResponse(
+            body=body,
+            status_code=response.status_code,
+            headers=[(name, value) for name, value in response.headers.raw if name != b"content-length"],
+            etag='"' + hashlib.sha256(body).hexdigest()[:32] + '"',
+            expires_at=time.monotonic() + remaining,
+        )
+
+    async def get_or_render(self, key: Tuple, render: Callable):
+        """
+        Returns the cached entry for `key`, or the result of `render()`: a new
+        CachedResponse, or a Response that can't be cached and belongs to this caller only.
+        """
+        while True:
+            entry = self.entries.get(key)
+            if entry is not None:
+                return entry
+
+            future = self._inflight.get(key)
+            if future is None:
+                future = asyncio.ensure_future(render())
+                self._inflight[key] = future
+
+                def done(f, key=key):
+                    self._inflight.pop(key, None)
+                    if not f.cancelled() and f.exception() is None:
+                        result = f.result()
+                        if isinstance(result, CachedResponse) and result.expires_at > time.monotonic():
+                            self.entries[key] = result
+
+                future.add_done_callback(done)
+                return await asyncio.shield(future)
+
+            try:
+                result = await asyncio.shield(future)
+            except Exception:
+                result = None
+            if isinstance(result, CachedResponse):
+                return result
+            # The leader's error or uncacheable response is its own: try again, possibly as the leader
+
+    def respond(self, entry: CachedResponse, request: Request) -> Response:
+        remaining = max(0, int(entry.expires_at - time.monotonic()))
+        if_none_match = request.headers.get("if-none-match", "")
+        if entry.etag in [tag.strip() for tag in if_none_match.split(",")]:
+            response = Response(status_code=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = Response(content=entry.body, status_code=entry.status_code)
+            response.headers.raw.extend(entry.headers)
+        response.headers["ETag"] = entry.etag
+        response.headers["Cache-Control"] = f"private, max-age={remaining}"
+        response.headers.add_vary_header("Authorization")
+        return response
+
+    def __call__(self, func: Callable) -> Callable:
+        """Wraps an endpoint that receives `token_data` from a JWTAuthenticator dependency"""
+        signature = inspect.signature(func)
+        request_param = next(
+            (name for name, param in signature.parameters.items() if param.annotation is Request),
+            None,
+        )
+        response_param = next(
+            (name for name, param in signature.parameters.items() if param.annotation is Response),
+            None,
+        )
+
+        @wraps(func)
+        async def wrapper(*args, token_data: TokenData, **kwargs):
+            request = kwargs[request_param] if request_param else kwargs.pop(_REQUEST_PARAM)
+            if request.method not in ("GET", "HEAD"):
+                return await func(*args, token_data=token_data, **kwargs)
+
+            entry = await self.get_or_render(
+                self.key(request, token_data),
+                lambda: self._render(
+                    lambda: func(*args, token_data=token_data, **kwargs),
+                    request,
+                    token_data,
+                    kwargs.get(response_param) if response_param else None,
+                ),
+            )
+            if not isinstance(entry, CachedResponse):
+                return entry
+            return self.respond(entry, request)
+
+        if request_param is None:
+            # FastAPI reads the endpoint signature, so expose the Request we need
+            parameters = list(signature.parameters.values())
+            parameters.append(
+                inspect.Parameter(_REQUEST_PARAM, inspect.Parameter.KEYWORD_ONLY, annotation=Request)
+            )
+            wrapper.__signature__ = signature.replace(parameters=parameters)
+        wrapper.cache = self
+        return wrapper
@@ -1,5 +1,6 @@
 import uvicorn
 import logging
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Depends
 from dotenv import load_dotenv
 import os
@@ -24,12 +25,10 @@ else:
 
 
 # from fastapi_supabase.config import SupabaseAuthConfig
-from fastapi_supabase import (JWTAuthenticator, add_cors_middleware)
+from fastapi_supabase import (JWTAuthenticator, TokenRefresher, add_cors_middleware)
 from fastapi_supabase.config import SupabaseAuthConfig
 from fastapi_supabase.models import TokenData
 
-app = FastAPI()
-
 def initialize_auth():
     """
     Initialize authentication configuration and JWT authenticator
@@ -43,6 +42,7 @@ def initialize_auth():
             supa_anon_key=os.getenv("SUPABASE_ANON_KEY"),
             supa_jwks_url=f"{os.getenv("SUPABASE_URL")}/auth/v1/.well-known/jwks.json",
             supa_use_legacy_jwt=os.getenv("SUPABASE_USE_LEGACY_JWT", "False").lower() == "true",
+            supa_jwt_mode=os.getenv("SUPABASE_JWT_MODE") or None,
             dev_mode=False
         )
         jwt_auth = JWTAuthenticator(config)
@@ -54,9 +54,23 @@ def initialize_auth():
 # Initialize authentication
 config, jwt_auth = initialize_auth()
 
+# POST /auth/refresh: coalesced server-side refresh of expired access tokens
+refresher = TokenRefresher(jwt_auth)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    # Close the refresher's pooled HTTP client and stop the authenticator's lag monitor
+    await refresher.aclose()
+    await jwt_auth.aclose()
+
+app = FastAPI(lifespan=lifespan)
+
 # Add CORS middleware
 add_cors_middleware(app, config)
 
+app.include_router(refresher.router)
+
 @app.get("/public")
 async def public_endpoint():
     return {"message": "This is a public endpoint"}
@@ -0,0 +1,59 @@
+import asyncio
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+
+import httpx
+import jwt
+
+from fastapi_supabase.auth import JWTAuthenticator
+from fastapi_supabase.config import SupabaseAuthConfig
+
+HS256_SECRET = "super-secret-jwt-token-with-at-least-32-characters-long"
+
+
+def make_token(sub="user-1", role="authenticated", expires_in=3600, **claims):
+    """HS256 token verified by every `legacy_auth()` authenticator"""
+    payload = {
+        "sub": sub,
+        "role": role,
+        "is_anonymous": False,
+        "exp": datetime.now(timezone.utc) + timedelta(seconds=expires_in),
+        **claims,
+    }
+    return jwt.encode(payload, HS256_SECRET, algorithm="HS256")
+
+
+def auth_headers(token):
+    return {"Authorization": f"Bearer {token}"}
+
+
+def legacy_auth(**settings):
+    config = SupabaseAuthConfig(supa_jwt_secret=HS256_SECRET, supa_use_legacy_jwt=True, **settings)
+    return JWTAuthenticator(config)
+
+
+def slow_down(jwt_auth, delay=0.2):
+    """Delays every verification, standing in for a stalled JWKS refresh or CPU-bound decode"""
+    decode_token = jwt_auth.checker.decode_token
+
+    async def slow_decode_token(token):
+        await asyncio.sleep(delay)
+        return await decode_token(token)
+
+    jwt_auth.checker.decode_token = slow_decode_token
+
+
+@asynccontextmanager
+async def asgi_client(app):
+    """Drives an app in-process on the running loop, so requests can overlap"""
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        yield client
+
+
+def get_concurrently(app, url, headers_list):
+    """GETs `url` once per headers dict, all at the same time"""
+    async def run():
+        async with asgi_client(app) as client:
+            return await asyncio.gather(*(client.get(url, headers=headers) for headers in headers_list))
+    return asyncio.run(run())
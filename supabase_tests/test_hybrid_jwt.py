@@ -0,0 +1,87 @@
+import jwt
+from fastapi import Depends, FastAPI
+from fastapi.testclient import TestClient
+
+from fastapi_supabase.auth import JWTAuthenticator
+from fastapi_supabase.config import SupabaseAuthConfig
+from fastapi_supabase.hybrid_jwt_checker import HybridJWTChecker
+from fastapi_supabase.loadtest import JWKSServer, KeySet, mint_tokens
+from fastapi_supabase.models import TokenData
+
+SUPABASE_URL = "http://supabase.local"
+ISSUER = f"{SUPABASE_URL}/auth/v1"
+
+keyset = KeySet.generate(["RS256", "ES256", "HS256"])
+rs, es, hs = keyset.keys
+jwks_server = JWKSServer(keyset)
+
+config = SupabaseAuthConfig(
+    supa_url=SUPABASE_URL,
+    supa_jwks_url=jwks_server.url,
+    supa_jwt_secret=hs.key,
+    supa_jwt_mode="hybrid",
+)
+jwt_auth = JWTAuthenticator(config)
+
+app = FastAPI()
+
+
+@app.get("/protected")
+async def protected(token_data: TokenData = Depends(jwt_auth)):
+    return {"user_id": token_data.user_id}
+
+
+client = TestClient(app)
+
+
+def setup_module():
+    jwks_server.start()
+
+
+def teardown_module():
+    jwks_server.stop()
+
+
+def get(token):
+    return client.get("/protected", headers={"Authorization": f"Bearer {token}"})
+
+
+def test_hybrid_mode_selected():
+    assert isinstance(jwt_auth.checker, HybridJWTChecker)
+    assert SupabaseAuthConfig(supa_use_legacy_jwt=True).jwt_mode == "legacy"
+    assert SupabaseAuthConfig().jwt_mode == "jwks"
+
+
+def test_dispatches_each_algorithm_to_its_path():
+    checker = jwt_auth.checker
+    before_legacy = checker.stats["legacy"]["verified"]
+    before_jwks = checker.stats["jwks"]["verified"]
+    for key in (rs, es, hs):
+        (token,) = mint_tokens(keyset, 1, kids={key.kid: 1}, iss=ISSUER)
+        assert get(token).status_code == 200, key.alg
+    assert checker.stats["legacy"]["verified"] == before_legacy + 1
+    assert checker.stats["jwks"]["verified"] == before_jwks + 2
+    # Each path keeps its own state: only the JWKS path fetched keys
+    assert checker.jwks.jwks is not None
+    assert jwks_server.requests == 1
+
+
+def test_hs256_with_jwks_kid_stays_on_legacy_path():
+    # An HS256 token naming a JWKS kid must never be verified against that public key
+    forged = jwt.encode({"sub": "attacker", "role": "admin", "exp": 9999999999}, "not-the-secret" * 3,
+                        algorithm="HS256", headers={"kid": rs.kid})
+    failed = jwt_auth.checker.stats["legacy"]["failed"]
+    assert get(forged).status_code == 401
+    assert jwt_auth.checker.stats["legacy"]["failed"] == failed + 1
+
+
+def test_algorithms_outside_allowlist_are_rejected():
+    unsigned = jwt.encode({"sub": "attacker", "role": "admin", "exp": 9999999999}, None, algorithm="none")
+    response = get(unsigned)
+    assert response.status_code == 401
+    assert "unsupported_alg" in response.json()["detail"]["message"]
+
+    (token,) = mint_tokens(keyset, 1, kids={rs.kid: 1}, iss=ISSUER)
+    no_kid = jwt.encode(jwt.decode(token, options={"verify_signature": False}), rs.key, algorithm="RS256")
+    assert get(no_kid).status_code == 401
+    assert jwt_auth.checker.stats["rejected"]["RS256"] >= 1
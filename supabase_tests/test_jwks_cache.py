@@ -0,0 +1,94 @@
+import asyncio
+import time
+
+import pytest
+from fastapi import HTTPException
+
+from fastapi_supabase.config import SupabaseAuthConfig
+from fastapi_supabase.jwt_checker import JWTChecker
+from fastapi_supabase.loadtest import JWKSServer, KeySet, mint_tokens
+
+SUPABASE_URL = "http://supabase.local"
+ISSUER = f"{SUPABASE_URL}/auth/v1"
+
+keyset = KeySet.generate(["RS256"])
+
+
+def make_checker(url, **kwargs):
+    config = SupabaseAuthConfig(supa_url=SUPABASE_URL, supa_jwks_url=url, **kwargs)
+    return JWTChecker(config)
+
+
+@pytest.mark.parametrize("cache_control, bounds, expected", [
+    ("public, max-age=600", {}, 600),
+    ("max-age=5", {"supa_jwks_min_ttl": 30}, 30),
+    ("max-age=999999", {"supa_jwks_max_ttl": 120}, 120),
+])
+def test_jwks_honors_max_age_within_bounds(cache_control, bounds, expected):
+    with JWKSServer(keyset, cache_control=cache_control) as server:
+        checker = make_checker(server.url, supa_jwks_refresh_jitter=0, **bounds)
+        asyncio.run(checker.get_jwks())
+        assert expected - 1 < checker.jwks_expires_at - time.monotonic() <= expected
+
+
+def test_jwks_served_from_cache_until_expiry():
+    tokens = mint_tokens(keyset, 10, iss=ISSUER)
+    with JWKSServer(keyset) as server:
+        checker = make_checker(server.url)
+
+        async def run():
+            await asyncio.gather(*(checker.decode_token(token) for token in tokens))
+
+        asyncio.run(run())
+        assert server.requests == 1
+
+
+def test_jwks_revalidates_with_etag():
+    (key,) = keyset.keys
+    with JWKSServer(keyset) as server:
+        checker = make_checker(server.url)
+        jwks = asyncio.run(checker.get_jwks())
+        public_key = checker.get_public_key(key.kid, jwks, "RS256")
+        etag = checker.jwks_etag
+
+        checker.jwks_expires_at = 0
+        assert asyncio.run(checker.get_jwks()) is jwks
+        assert server.requests == 2
+        assert server.request_headers[1].get("If-None-Match") == etag
+        # Unchanged key set: the parsed key is reused as-is
+        assert checker.get_public_key(key.kid, jwks, "RS256") is public_key
+
+        # Rotated key set: a new ETag, so the document is downloaded again
+        server.keyset = KeySet.generate(["ES256"])
+        checker.jwks_expires_at = 0
+        assert asyncio.run(checker.get_jwks()) is not jwks
+        assert checker.jwks_etag != etag
+
+
+def test_jwks_refresh_is_jittered():
+    checker = make_checker("http://unused", supa_jwks_refresh_jitter=0.5)
+    ttls = {round(checker._jwks_ttl("max-age=1000"), 3) for _ in range(20)}
+    assert len(ttls) > 1
+    assert all(500 <= ttl <= 1000 for ttl in ttls)
+    # Jitter never takes the TTL below the configured minimum
+    assert all(checker._jwks_ttl("max-age=60") == 60 for _ in range(20))
+
+
+def test_unknown_kid_forces_one_rate_limited_refresh():
+    with JWKSServer(keyset, max_age=86400) as server:
+        checker = make_checker(server.url)
+        asyncio.run(checker.decode_token(mint_tokens(keyset, 1, iss=ISSUER)[0]))
+
+        checker.jwks_fetched_at -= 60  # the cached document is a minute old, far from expiry
+        rotated = KeySet.generate(["ES256"])
+        server.keyset = rotated
+        (token,) = mint_tokens(rotated, 1, iss=ISSUER)
+        assert asyncio.run(checker.decode_token(token))["sub"]
+        assert server.requests == 2
+
+        # Within supa_jwks_min_ttl of that refresh, unknown kids don't reach the endpoint
+        (unknown,) = mint_tokens(KeySet.generate(["RS256"]), 1, iss=ISSUER)
+        with pytest.raises(HTTPException) as error:
+            asyncio.run(checker.decode_token(unknown))
+        assert error.value.detail["code"] == "invalid_kid"
+        assert server.requests == 2
@@ -0,0 +1,138 @@
+import asyncio
+import time
+
+import jwt
+import pytest
+from fastapi import Depends, FastAPI
+
+from fastapi_supabase.auth import JWTAuthenticator
+from fastapi_supabase.config import SupabaseAuthConfig
+from fastapi_supabase.jwt_checker import JWTChecker
+from fastapi_supabase.loadtest import JWKSServer, KeySet, main, mint_tokens, run_load
+from fastapi_supabase.models import TokenData
+
+SUPABASE_URL = "http://supabase.local"
+ISSUER = f"{SUPABASE_URL}/auth/v1"
+
+
+def make_app(jwks_url):
+    config = SupabaseAuthConfig(supa_url=SUPABASE_URL, supa_jwks_url=jwks_url)
+    jwt_auth = JWTAuthenticator(config)
+    app = FastAPI()
+
+    @app.get("/admin")
+    @jwt_auth.require_anyof_roles(["admin"])
+    async def admin(token_data: TokenData = Depends(jwt_auth)):
+        return {"user_id": token_data.user_id}
+
+    return app
+
+
+def test_mint_tokens_controls_claims_and_kid_mix():
+    keyset = KeySet.generate(["RS256", "ES256", "HS256"])
+    rs, es, hs = keyset.keys
+    tokens = mint_tokens(
+        keyset,
+        200,
+        roles={"authenticated": 3, "admin": 1},
+        kids={rs.kid: 1, es.kid: 1},
+        anonymous_ratio=0.5,
+        users=10,
+        seed=1,
+    )
+    headers = [jwt.get_unverified_header(t) for t in tokens]
+    payloads = [jwt.decode(t, options={"verify_signature": False}) for t in tokens]
+    assert {h["kid"] for h in headers} == {rs.kid, es.kid}
+    assert {p["role"] for p in payloads} == {"authenticated", "admin"}
+    assert {p["is_anonymous"] for p in payloads} == {True, False}
+    assert len({p["sub"] for p in payloads}) <= 10
+    assert keyset.hs256_secret == hs.key
+    assert len(keyset.jwks()["keys"]) == 2
+
+
+def test_keyset_round_trip(tmp_path):
+    keyset = KeySet.generate(["ES256", "HS256"])
+    keyset.save(str(tmp_path))
+    loaded = KeySet.load(str(tmp_path))
+    assert loaded.jwks() == keyset.jwks()
+    es, hs = keyset.keys
+    token = mint_tokens(loaded, 1, kids={es.kid: 1})[0]
+    jwt.decode(token, es.key.public_key(), algorithms=["ES256"], audience="authenticated")
+    assert loaded.hs256_secret == hs.key
+
+
+def test_run_load_reports_status_and_error_codes():
+    keyset = KeySet.generate(["RS256", "ES256"])
+    admins = mint_tokens(keyset, 20, roles={"admin": 1}, iss=ISSUER)
+    users = mint_tokens(keyset, 10, roles={"authenticated": 1}, iss=ISSUER)
+    expired = mint_tokens(keyset, 10, roles={"admin": 1}, iss=ISSUER, expiry=(-3600, -1800))
+
+    with JWKSServer(keyset) as server:
+        app = make_app(server.url)
+        report = asyncio.run(
+            run_load("http://test/admin", admins + users + expired, total_requests=200, concurrency=20, app=app)
+        )
+        assert server.requests == 1
+
+    assert report.requests == 200
+    assert report.status_codes[200] == 100
+    assert report.status_codes[403] == 50
+    assert report.status_codes[401] == 50
+    assert report.error_codes["insufficient_permissions"] == 50
+    assert report.error_codes["authentication_failed"] == 50
+    assert report.throughput > 0
+    assert report.percentile(50) <= report.percentile(99)
+
+
+def test_cli_keys_and_mint(tmp_path, capsys):
+    main(["keys", "--out", str(tmp_path), "--alg", "RS256", "--alg", "HS256"])
+    capsys.readouterr()
+    main(["mint", "--keys", str(tmp_path), "--count", "5", "--role", "admin"])
+    tokens = capsys.readouterr().out.split()
+    assert len(tokens) == 5
+
+
+def test_jwks_server_keeps_max_age_on_revalidation():
+    keyset = KeySet.generate(["RS256"])
+    with JWKSServer(keyset, max_age=300) as server:
+        config = SupabaseAuthConfig(supa_url=SUPABASE_URL, supa_jwks_url=server.url, supa_jwks_refresh_jitter=0)
+        checker = JWTChecker(config)
+        asyncio.run(checker.get_jwks())
+        checker.jwks_expires_at = 0
+        asyncio.run(checker.get_jwks())
+        assert server.requests == 2
+        assert 299 < checker.jwks_expires_at - time.monotonic() <= 300
+
+
+def test_cli_rejects_bad_arguments(tmp_path, capsys):
+    main(["keys", "--out", str(tmp_path)])
+    with pytest.raises(SystemExit):
+        main(["mint", "--keys", str(tmp_path), "--expiry-min", "10", "--expiry-max", "5"])
+    assert "--expiry-min" in capsys.readouterr().err
+
+    empty = tmp_path / "tokens.txt"
+    empty.write_text("\n")
+    with pytest.raises(SystemExit):
+        main(["load", "--url", "http://127.0.0.1:9/", "--tokens", str(empty)])
+    assert "no tokens" in capsys.readouterr().err
+
+    for bad, message in [
+        (["--kid", "nope"], "unknown --kid nope"),
+        (["--role", "admin:x"], "'admin:x'"),
+        (["--role", "admin:0"], "positive weight"),
+        (["--anonymous-ratio", "1.5"], "--anonymous-ratio"),
+    ]:
+        with pytest.raises(SystemExit):
+            main(["mint", "--keys", str(tmp_path), *bad])
+        assert message in capsys.readouterr().err
+
+
+def test_default_kids_are_the_published_keys():
+    keyset = KeySet.generate(["RS256", "ES256", "HS256"])
+    published = {jwk["kid"] for jwk in keyset.jwks()["keys"]}
+    tokens = mint_tokens(keyset, 50, seed=2)
+    assert {jwt.get_unverified_header(t)["kid"] for t in tokens} == published
+
+    (hs,) = KeySet.generate(["HS256"]).keys
+    (token,) = mint_tokens(KeySet([hs]), 1)
+    assert jwt.get_unverified_header(token)["alg"] == "HS256"
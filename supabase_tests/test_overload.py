@@ -0,0 +1,103 @@
+import asyncio
+import time
+
+from fastapi import Depends, FastAPI, HTTPException
+from fastapi.security import HTTPAuthorizationCredentials
+
+from fastapi_supabase.models import TokenData
+from helpers import asgi_client, auth_headers, get_concurrently, legacy_auth, make_token, slow_down
+
+
+def make_app(**settings):
+    jwt_auth = legacy_auth(**settings)
+    slow_down(jwt_auth)
+    app = FastAPI()
+
+    @app.get("/protected")
+    async def protected(token_data: TokenData = Depends(jwt_auth)):
+        return {"user_id": token_data.user_id}
+
+    return app, jwt_auth
+
+
+def get_all(app, tokens):
+    return get_concurrently(app, "/protected", [auth_headers(t) for t in tokens])
+
+
+def test_inflight_cap_sheds_with_retry_after():
+    app, jwt_auth = make_app(auth_max_inflight=2, auth_retry_after=3)
+    responses = get_all(app, [make_token(f"user-{i}") for i in range(10)])
+    codes = [r.status_code for r in responses]
+    assert codes.count(200) == 2
+    assert codes.count(503) == 8
+    shed = next(r for r in responses if r.status_code == 503)
+    assert shed.headers["retry-after"] == "3"
+    assert shed.json()["detail"]["code"] == "overloaded"
+    assert jwt_auth.stats["shed_inflight"] == 8
+    assert jwt_auth.inflight == 0
+
+
+def test_cached_tokens_bypass_admission():
+    app, jwt_auth = make_app(auth_max_inflight=1, auth_token_cache_ttl=60)
+    warm = make_token("warm")
+    assert get_all(app, [warm])[0].status_code == 200
+
+    responses = get_all(app, [make_token("cold-1"), make_token("cold-2"), warm, warm])
+    assert [r.status_code for r in responses] == [200, 503, 200, 200]
+    assert jwt_auth.stats["cache_hits"] == 2
+
+
+def test_token_cache_is_off_by_default():
+    app, jwt_auth = make_app()
+    token = make_token("user")
+    get_all(app, [token])
+    get_all(app, [token])
+    assert jwt_auth.stats["cache_hits"] == 0
+    assert len(jwt_auth.token_cache) == 0
+
+
+def test_event_loop_lag_sheds_uncached_requests():
+    app, jwt_auth = make_app(auth_max_loop_lag_ms=50, auth_token_cache_ttl=60)
+    warm = make_token("warm")
+
+    async def run():
+        async with asgi_client(app) as client:
+            ok = await client.get("/protected", headers=auth_headers(warm))
+            time.sleep(0.3)  # block the loop so the monitor sees the lag
+            await asyncio.sleep(0.15)
+            lagging = jwt_auth.loop_lag_ms
+            cold = await client.get("/protected", headers=auth_headers(make_token("cold")))
+            cached = await client.get("/protected", headers=auth_headers(warm))
+        monitor = jwt_auth._lag_monitor
+        await jwt_auth.aclose()
+        return ok, lagging, cold, cached, monitor
+
+    ok, lagging, cold, cached, monitor = asyncio.run(run())
+    assert ok.status_code == 200
+    assert lagging > 50
+    assert cold.status_code == 503
+    assert cached.status_code == 200
+    assert jwt_auth.stats["shed_loop_lag"] == 1
+    assert monitor.cancelled()
+    assert jwt_auth._lag_monitor is None
+
+
+def test_require_auth_is_admission_controlled():
+    app, jwt_auth = make_app(auth_max_inflight=1)
+
+    @jwt_auth.require_auth
+    async def handler(token_data: TokenData):
+        return token_data.user_id
+
+    def call(sub):
+        return handler(credentials=HTTPAuthorizationCredentials(scheme="Bearer", credentials=make_token(sub)))
+
+    async def run():
+        return await asyncio.gather(call("first"), call("second"), return_exceptions=True)
+
+    first, second = asyncio.run(run())
+    assert first == "first"
+    assert isinstance(second, HTTPException)
+    assert second.status_code == 503
+    assert second.headers["Retry-After"] == "1"
+    assert jwt_auth.stats["shed_inflight"] == 1
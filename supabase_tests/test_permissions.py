@@ -0,0 +1,134 @@
+import asyncio
+
+from fastapi import Depends, FastAPI
+
+from fastapi_supabase.models import TokenData
+from fastapi_supabase.permissions import InMemoryPermissionFetcher, PermissionLoader
+from helpers import auth_headers, get_concurrently, legacy_auth, make_token
+
+jwt_auth = legacy_auth()
+
+
+def make_app(fetcher, **kwargs):
+    loader = PermissionLoader(jwt_auth, fetcher, **kwargs)
+    app = FastAPI()
+
+    @app.get("/orgs/admin")
+    @loader.require_anyof_roles(["org_admin"])
+    async def org_admin(token_data: TokenData = Depends(jwt_auth)):
+        return {"user_id": token_data.user_id}
+
+    @app.get("/me/permissions")
+    async def my_permissions(permissions=Depends(loader.current_permissions)):
+        return sorted(permissions)
+
+    return app, loader
+
+
+def get_all(app, path, subs):
+    """GETs `path` concurrently, once per subject"""
+    return get_concurrently(app, path, [auth_headers(make_token(s)) for s in subs])
+
+
+def test_concurrent_lookups_are_batched():
+    fetcher = InMemoryPermissionFetcher({f"user-{i}": {"org_admin"} for i in range(0, 20, 2)}, delay=0.05)
+    app, loader = make_app(fetcher, batch_window=0.02)
+    subs = [f"user-{i}" for i in range(20)] * 2
+    responses = get_all(app, "/orgs/admin", subs)
+    assert [r.status_code for r in responses[:20]] == [200, 403] * 10
+    assert responses[1].json()["detail"]["code"] == "insufficient_permissions"
+    assert len(fetcher.batches) == 1
+    assert sorted(fetcher.batches[0]) == sorted(set(subs))
+
+
+def test_max_batch_size_splits_batches():
+    fetcher = InMemoryPermissionFetcher()
+    app, loader = make_app(fetcher, batch_window=0.05, max_batch_size=4)
+    get_all(app, "/me/permissions", [f"user-{i}" for i in range(10)])
+    assert [len(b) for b in fetcher.batches] == [4, 4, 2]
+
+
+def test_results_are_cached_until_invalidated():
+    fetcher = InMemoryPermissionFetcher({"alice": {"member"}})
+    app, loader = make_app(fetcher)
+    assert get_all(app, "/me/permissions", ["alice"])[0].json() == ["member"]
+    assert get_all(app, "/orgs/admin", ["alice"])[0].status_code == 403
+    assert len(fetcher.batches) == 1
+
+    fetcher.permissions["alice"].add("org_admin")
+    assert get_all(app, "/orgs/admin", ["alice"])[0].status_code == 403
+    loader.invalidate("alice")
+    assert get_all(app, "/orgs/admin", ["alice"])[0].status_code == 200
+    assert len(fetcher.batches) == 2
+
+    loader.invalidate()
+    assert len(loader.cache) == 0
+
+
+def test_fetch_errors_reach_every_waiter_and_are_not_cached():
+    calls = []
+
+    async def failing_fetch(user_ids):
+        calls.append(user_ids)
+        raise RuntimeError("database unavailable")
+
+    loader = PermissionLoader(jwt_auth, failing_fetch)
+
+    async def run():
+        return await asyncio.gather(*(loader.load(u) for u in ["a", "b", "a"]), return_exceptions=True)
+
+    results = asyncio.run(run())
+    assert all(isinstance(r, RuntimeError) for r in results)
+    assert len(calls) == 1
+    assert len(loader.cache) == 0
+
+
+def test_dispatch_tasks_are_referenced_until_done():
+    fetcher = InMemoryPermissionFetcher({"alice": {"member"}}, delay=0.05)
+    loader = PermissionLoader(jwt_auth, fetcher, batch_window=0)
+
+    async def run():
+        load = asyncio.ensure_future(loader.load("alice"))
+        await asyncio.sleep(0.01)
+        running = len(loader._dispatches)
+        result = await load
+        return running, result
+
+    running, result = asyncio.run(run())
+    assert running == 1
+    assert result == {"member"}
+    assert not loader._dispatches
+
+
+def test_malformed_fetch_results_fail_the_batch():
+    async def fetch(user_ids):
+        return {user_id: None for user_id in user_ids}
+
+    loader = PermissionLoader(jwt_auth, fetch)
+
+    async def run():
+        results = await asyncio.wait_for(
+            asyncio.gather(*(loader.load(u) for u in ["a", "b"]), return_exceptions=True), timeout=1
+        )
+        loader.fetch = InMemoryPermissionFetcher({"a": {"member"}})
+        return results, await asyncio.wait_for(loader.load("a"), timeout=1)
+
+    results, retried = asyncio.run(run())
+    assert all(isinstance(r, TypeError) for r in results)
+    assert retried == {"member"}
+    assert not loader._pending
+
+
+def test_cancelled_dispatch_releases_waiters():
+    loader = PermissionLoader(jwt_auth, InMemoryPermissionFetcher(delay=10), batch_window=0)
+
+    async def run():
+        load = asyncio.ensure_future(loader.load("a"))
+        await asyncio.sleep(0.01)
+        (dispatch,) = loader._dispatches
+        dispatch.cancel()
+        return await asyncio.wait_for(asyncio.gather(load, return_exceptions=True), timeout=1)
+
+    (result,) = asyncio.run(run())
+    assert isinstance(result, asyncio.CancelledError)
+    assert not loader._pending
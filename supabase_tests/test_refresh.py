@@ -0,0 +1,191 @@
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from fastapi import Depends, FastAPI
+
+from fastapi_supabase.models import TokenData
+from fastapi_supabase.refresh import TokenRefresher
+from helpers import asgi_client, auth_headers, legacy_auth, make_token, slow_down
+
+ANON_KEY = "anon-key"
+
+
+class AuthServer:
+    """Local stand-in for Supabase Auth's /token?grant_type=refresh_token endpoint"""
+
+    def __init__(self, delay=0.1):
+        self.delay = delay
+        self.calls = []
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                server.calls.append({"path": self.path, "apikey": self.headers.get("apikey"), **body})
+                time.sleep(server.delay)
+                refresh_token = body["refresh_token"]
+                if refresh_token == "revoked":
+                    self.reply(400, {"error": "invalid_grant", "error_description": "Invalid Refresh Token"})
+                    return
+                if refresh_token == "gateway-page":
+                    self.reply(200, "<html>Bad gateway</html>")
+                    return
+                session = {
+                    "access_token": make_token(n=len(server.calls)),
+                    "token_type": "bearer",
+                    "expires_in": 3600,
+                    "refresh_token": f"rotated-{len(server.calls)}",
+                }
+                if refresh_token == "no-access-token":
+                    del session["access_token"]
+                elif refresh_token == "unverifiable":
+                    session["access_token"] = "not-a-jwt"
+                self.reply(200, session)
+
+            def reply(self, code, data):
+                if isinstance(data, str):
+                    body, content_type = data.encode(), "text/html"
+                else:
+                    body, content_type = json.dumps(data).encode(), "application/json"
+                self.send_response(code)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+
+
+auth_server = AuthServer()
+
+
+def setup_module():
+    threading.Thread(target=auth_server.httpd.serve_forever, daemon=True).start()
+
+
+def teardown_module():
+    auth_server.httpd.shutdown()
+    auth_server.httpd.server_close()
+
+
+def setup_function():
+    auth_server.calls.clear()
+
+
+def make_app(supa_url=auth_server.url, **settings):
+    jwt_auth = legacy_auth(supa_url=supa_url, supa_anon_key=ANON_KEY, auth_token_cache_ttl=60, **settings)
+    refresher = TokenRefresher(jwt_auth)
+    app = FastAPI()
+    app.include_router(refresher.router)
+
+    @app.get("/protected")
+    async def protected(token_data: TokenData = Depends(jwt_auth)):
+        return {"user_id": token_data.user_id}
+
+    return app, jwt_auth, refresher
+
+
+def refresh_all(app, refresher, refresh_tokens):
+    """Posts each refresh token concurrently, then closes the refresher's pooled client"""
+    async def run():
+        async with asgi_client(app) as client:
+            responses = await asyncio.gather(
+                *(client.post("/auth/refresh", json={"refresh_token": rt}) for rt in refresh_tokens)
+            )
+        await refresher.aclose()
+        return responses
+    return asyncio.run(run())
+
+
+def test_concurrent_refreshes_are_coalesced():
+    app, jwt_auth, refresher = make_app()
+
+    async def run():
+        async with asgi_client(app) as client:
+            refreshes = await asyncio.gather(
+                *(client.post("/auth/refresh", json={"refresh_token": "rt-1"}) for _ in range(10))
+            )
+            access_token = refreshes[0].json()["access_token"]
+            protected = await client.get("/protected", headers=auth_headers(access_token))
+            later = await client.post("/auth/refresh", json={"refresh_token": "rt-1"})
+            other = await client.post("/auth/refresh", json={"refresh_token": "rt-2"})
+        await refresher.aclose()
+        return refreshes, protected, later, other
+
+    refreshes, protected, later, other = asyncio.run(run())
+
+    assert all(r.status_code == 200 for r in refreshes)
+    assert len({r.json()["access_token"] for r in refreshes}) == 1
+    # Briefly cached: a repeat within the TTL doesn't reach upstream either
+    assert later.json() == refreshes[0].json()
+    assert other.json()["refresh_token"] != later.json()["refresh_token"]
+    assert len(auth_server.calls) == 2
+    assert auth_server.calls[0]["path"] == "/auth/v1/token?grant_type=refresh_token"
+    assert auth_server.calls[0]["apikey"] == ANON_KEY
+
+    # The refreshed access token was already verified by the refresh call
+    assert protected.status_code == 200
+    assert jwt_auth.stats["cache_hits"] == 1
+
+
+def test_upstream_errors_are_passed_through_and_not_cached():
+    app, jwt_auth, refresher = make_app()
+    (first,) = refresh_all(app, refresher, ["revoked"])
+    (second,) = refresh_all(app, refresher, ["revoked"])
+    assert first.status_code == 400
+    assert first.json()["detail"] == {"code": "refresh_failed", "message": "Invalid Refresh Token"}
+    assert second.status_code == 400
+    assert len(auth_server.calls) == 2
+
+
+def test_unreachable_upstream_returns_502():
+    app, jwt_auth, refresher = make_app("http://127.0.0.1:9")
+    (response,) = refresh_all(app, refresher, ["rt"])
+    assert response.status_code == 502
+    assert response.json()["detail"]["code"] == "refresh_unavailable"
+
+
+def test_non_json_upstream_success_returns_502():
+    app, jwt_auth, refresher = make_app()
+    (response,) = refresh_all(app, refresher, ["gateway-page"])
+    assert response.status_code == 502
+    assert response.json()["detail"]["code"] == "refresh_unavailable"
+    assert len(auth_server.calls) == 1
+
+
+def test_refresh_returns_session_while_auth_is_overloaded():
+    app, jwt_auth, refresher = make_app(auth_max_inflight=1)
+    slow_down(jwt_auth)
+
+    async def run():
+        async with asgi_client(app) as client:
+            protected = asyncio.ensure_future(client.get("/protected", headers=auth_headers(make_token("busy"))))
+            await asyncio.sleep(0.05)
+            refreshed = await client.post("/auth/refresh", json={"refresh_token": "rt-busy"})
+            await protected
+        await refresher.aclose()
+        return refreshed
+
+    refreshed = asyncio.run(run())
+    assert refreshed.status_code == 200
+    assert refreshed.json()["refresh_token"] == "rotated-1"
+    assert len(auth_server.calls) == 1
+    # Seeding bypasses admission control, so the new token is still cached
+    assert refreshed.json()["access_token"] in jwt_auth.token_cache
+
+
+def test_session_without_access_token_is_still_returned():
+    app, jwt_auth, refresher = make_app()
+    missing, unverifiable = refresh_all(app, refresher, ["no-access-token", "unverifiable"])
+    assert missing.status_code == 200
+    assert "access_token" not in missing.json()
+    assert unverifiable.status_code == 200
+    assert unverifiable.json()["access_token"] == "not-a-jwt"
+    assert len(jwt_auth.token_cache) == 0
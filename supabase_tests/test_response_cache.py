@@ -0,0 +1,170 @@
+import asyncio
+import time
+
+from fastapi import Depends, FastAPI, HTTPException, Response
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+from pydantic import BaseModel
+
+from fastapi_supabase.models import TokenData
+from helpers import auth_headers, get_concurrently, legacy_auth, make_token
+
+jwt_auth = legacy_auth()
+calls = {"user": 0, "role": 0, "profile": 0, "banner": 0, "lookup": 0}
+
+app = FastAPI()
+
+
+@app.get("/me")
+@jwt_auth.require_anyof_roles(["authenticated", "admin"])
+@jwt_auth.cached(ttl=60, scope="user")
+async def me(token_data: TokenData = Depends(jwt_auth)):
+    calls["user"] += 1
+    return {"user_id": token_data.user_id, "call": calls["user"]}
+
+
+@app.get("/catalog")
+@jwt_auth.require_anyof_roles(["authenticated", "admin"])
+@jwt_auth.cached(ttl=60, scope="role")
+async def catalog(page: int = 1, token_data: TokenData = Depends(jwt_auth)):
+    calls["role"] += 1
+    await asyncio.sleep(0.05)
+    return {"role": token_data.role, "page": page, "call": calls["role"]}
+
+
+class Profile(BaseModel):
+    user_id: str
+
+
+@app.get("/profile", response_model=Profile, status_code=202)
+@jwt_auth.cached(ttl=60, scope="user")
+async def profile(response: Response, token_data: TokenData = Depends(jwt_auth)):
+    calls["profile"] += 1
+    response.headers["X-Custom"] = "yes"
+    response.set_cookie("seen", "1")
+    return {"user_id": token_data.user_id, "secret": "leak"}
+
+
+@app.get("/banner")
+@jwt_auth.cached(ttl=60, scope="role")
+async def banner(response: Response, token_data: TokenData = Depends(jwt_auth)):
+    calls["banner"] += 1
+    response.set_cookie("user", token_data.user_id)
+    return {"banner": "hello"}
+
+
+@app.get("/lookup")
+@jwt_auth.cached(ttl=60, scope="role")
+async def lookup(token_data: TokenData = Depends(jwt_auth)):
+    calls["lookup"] += 1
+    await asyncio.sleep(0.05)
+    if token_data.user_id == "ghost":
+        raise HTTPException(status_code=404, detail="ghost")
+    if token_data.user_id == "mallory":
+        return Response(content="mallory only", status_code=409)
+    return {"items": [1, 2, 3]}
+
+
+@app.get("/export")
+@jwt_auth.cached(ttl=60, scope="public")
+async def export(token_data: TokenData = Depends(jwt_auth)):
+    async def rows():
+        for i in range(3):
+            await asyncio.sleep(0.01)
+            yield f"row-{i}\n"
+    return StreamingResponse(rows(), media_type="text/plain")
+
+
+client = TestClient(app)
+
+
+def get(url, sub, role="authenticated", **headers):
+    return client.get(url, headers={**auth_headers(make_token(sub, role=role)), **headers})
+
+
+def test_user_scope_caches_per_user():
+    first = get("/me", "alice")
+    again = get("/me", "alice")
+    other = get("/me", "bob")
+    assert first.status_code == 200
+    assert again.json() == first.json()
+    assert other.json()["user_id"] == "bob"
+    assert other.json()["call"] == first.json()["call"] + 1
+
+
+def test_etag_revalidation_returns_304():
+    etag = get("/me", "carol").headers["etag"]
+    revalidated = get("/me", "carol", **{"If-None-Match": etag})
+    assert revalidated.status_code == 304
+    assert revalidated.headers["etag"] == etag
+
+
+def test_role_scope_shared_and_keyed_by_query():
+    alice = get("/catalog?page=1", "alice")
+    bob = get("/catalog?page=1", "bob")
+    page2 = get("/catalog?page=2", "bob")
+    admin = get("/catalog?page=1", "dave", role="admin")
+    assert bob.json() == alice.json()
+    assert page2.json()["call"] != alice.json()["call"]
+    assert admin.json()["role"] == "admin"
+
+
+def test_role_check_still_applies_on_hit():
+    get("/catalog", "alice")
+    assert get("/catalog", "eve", role="guest").status_code == 403
+
+
+def test_entry_does_not_outlive_token():
+    me.cache.clear()
+    client.get("/me", headers=auth_headers(make_token("frank", expires_in=5)))
+    (entry,) = me.cache.entries.values()
+    assert entry.expires_at - time.monotonic() <= 5
+
+
+def test_concurrent_misses_are_coalesced():
+    before = calls["role"]
+    responses = get_concurrently(app, "/catalog?page=9", [auth_headers(make_token("grace"))] * 10)
+    assert all(r.status_code == 200 for r in responses)
+    assert calls["role"] == before + 1
+
+
+def test_response_model_status_code_and_headers_are_kept():
+    first = get("/profile", "heidi")
+    hit = get("/profile", "heidi")
+    for response in (first, hit):
+        assert response.status_code == 202
+        assert response.json() == {"user_id": "heidi"}
+        assert response.headers["x-custom"] == "yes"
+        assert "seen=1" in response.headers["set-cookie"]
+        assert response.headers["vary"] == "Authorization"
+    assert calls["profile"] == 1
+
+
+def test_cookies_are_not_cached_in_shared_scopes():
+    before = calls["banner"]
+    alice = get("/banner", "alice")
+    bob = get("/banner", "bob")
+    assert "user=alice" in alice.headers["set-cookie"]
+    assert "user=bob" in bob.headers["set-cookie"]
+    assert calls["banner"] == before + 2
+
+
+def test_uncacheable_results_are_not_shared_with_waiters():
+    lookup.cache.clear()
+    before = calls["lookup"]
+    subs = ["ghost", "mallory", "alice", "bob"]
+    responses = get_concurrently(app, "/lookup", [auth_headers(make_token(sub)) for sub in subs])
+    ghost, mallory, alice, bob = responses
+    assert ghost.status_code == 404
+    assert mallory.status_code == 409
+    assert mallory.text == "mallory only"
+    assert alice.json() == bob.json() == {"items": [1, 2, 3]}
+    # Waiters retry after a failed leader, and the first success is shared and cached
+    assert calls["lookup"] - before <= len(subs)
+    assert len(lookup.cache.entries) == 1
+
+
+def test_streaming_responses_are_rendered_per_request():
+    responses = get_concurrently(app, "/export", [auth_headers(make_token(f"user-{i}")) for i in range(3)])
+    assert [r.text for r in responses] == ["row-0\nrow-1\nrow-2\n"] * 3
+    assert len(export.cache.entries) == 0